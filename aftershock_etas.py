@@ -5,6 +5,7 @@
 # ============================================================
 
 import math
+import os
 from datetime import timedelta
 
 import numpy as np
@@ -20,79 +21,163 @@ M0 = 4.5                      # magnitude completeness
 ALPHA = 0.9                   # productivity scaling (USGS-like)
 DEFAULT_RADIUS_KM = 250       # regional influence
 TIME_WINDOWS = [1, 7, 30]     # day, week, month
+WINDOW_LABELS = {1: "1 Day", 7: "1 Week", 30: "1 Month"}
 MAG_THRESHOLDS = [5.0, 5.5, 6.0, 6.5]
 MAX_PROB = 0.97               # soft saturation (NOT lambda cap)
+DAY_NS = 86_400_000_000_000   # nanoseconds per day
 
 # ============================================================
 # Utilities
 # ============================================================
-def haversine(lat1, lon1, lat2, lon2):
+def haversine(lat0, lon0, lat_r, lon_r, cos_lat):
+    # (lat0, lon0) is a single point in degrees; lat_r/lon_r are catalog
+    # arrays in radians and cos_lat their cosines, precomputed at load
+    # time so only the query point's trig is evaluated per call.
+    # Works in place on two catalog-sized buffers.
     R = 6371.0
-    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = np.sin(dlat/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin(dlon/2)**2
-    return 2 * R * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    lat0, lon0 = math.radians(lat0), math.radians(lon0)
+
+    s = lon_r - lon0
+    s *= 0.5
+    np.sin(s, out=s)
+    s *= s                      # sin²(dlon/2)
+    s *= cos_lat
+    s *= math.cos(lat0)
+
+    a = lat_r - lat0
+    a *= 0.5
+    np.sin(a, out=a)
+    a *= a                      # sin²(dlat/2)
+    a += s
+
+    # 2*asin(sqrt(a)) == 2*atan2(sqrt(a), sqrt(1-a)); clip guards rounding
+    np.clip(a, 0.0, 1.0, out=a)
+    np.sqrt(a, out=a)
+    np.arcsin(a, out=a)
+    a *= 2 * R
+    return a
 
 
 def omori_rate(t, K, c, p):
     return K / ((c + t) ** p)
 
 
-def integrate_omori(K, c, p, T):
-    if T <= 0 or K <= 0:
-        return 0.0
-    if abs(p - 1.0) < 1e-6:
-        return K * math.log((c + T) / c)
-    return K / (1 - p) * ((c + T)**(1 - p) - c**(1 - p))
+def omori_jac(t, K, c, p):
+    # d(rate)/d(K, c, p), shape (len(t), 3)
+    u = (c + t) ** -p
+    return np.column_stack([u, -p * K * u / (c + t), -K * np.log(c + t) * u])
 
 
-def aki_b_value(mags, Mmin):
-    mags = mags[mags >= Mmin]
-    if len(mags) < 30:
+def make_integrator(K, c, p):
+    # Expected Omori count over [0, T], specialized once for the fitted
+    # parameters; the returned function takes a scalar or array T.
+    if K <= 0:
+        return lambda T: np.zeros_like(np.asarray(T, dtype=float))
+    if abs(p - 1.0) < 1e-6:
+        return lambda T: K * np.log((c + np.asarray(T, dtype=float)) / c)
+    q = 1 - p
+    cq = c ** q
+    return lambda T: K / q * ((c + np.asarray(T, dtype=float)) ** q - cq)
+
+
+def aki_b_value(mags, Mmin, mask=None):
+    # masked sum instead of copying the selected magnitudes out
+    sel = mags >= Mmin
+    if mask is not None:
+        sel &= mask
+    n = np.count_nonzero(sel)
+    if n < 30:
         return 1.0
-    return 0.4343 / (mags.mean() - Mmin)
+    return 0.4343 / (mags.sum(where=sel, dtype=np.float64) / n - Mmin)
 
 
 def gr_tail_prob(Mthr, b):
-    if Mthr <= M0:
-        return 1.0
-    return 10 ** (-b * (Mthr - M0))
+    Mthr = np.asarray(Mthr, dtype=float)
+    return np.where(Mthr <= M0, 1.0, 10 ** (-b * (Mthr - M0)))
 
 
 # ============================================================
 # Load catalog (compatible with your USGS downloader)
 # ============================================================
+def read_catalog(path):
+    # The parsed catalog is cached as Parquet next to the CSV and reused
+    # for as long as it is newer than the CSV.
+    pq_path = os.path.splitext(path)[0] + ".parquet"
+    if os.path.exists(pq_path) and (
+        not os.path.exists(path) or os.path.getmtime(pq_path) >= os.path.getmtime(path)
+    ):
+        try:
+            return pd.read_parquet(pq_path)
+        except Exception:
+            pass    # unreadable cache, fall back to the CSV
+
+    # Arrow's multithreaded reader parses ISO timestamps natively, so the
+    # to_datetime below only localizes them to UTC
+    df = pd.read_csv(path, engine="pyarrow")
+    df["time"] = pd.to_datetime(df["time"], format="ISO8601", utc=True)
+    df = df.dropna(subset=["time", "mag", "lat", "lon"])
+    # write to a temp file and rename, so a partial write never
+    # replaces the cache
+    tmp_path = f"{pq_path}.{os.getpid()}.tmp"
+    try:
+        df.to_parquet(tmp_path, compression="zstd")
+        os.replace(tmp_path, pq_path)
+    except OSError:
+        # cache is best effort
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    return df
+
+
 @st.cache_data
 def load_catalog(path):
-    df = pd.read_csv(path)
-    df["time"] = pd.to_datetime(df["time"], format="mixed", utc=True)
-    return df.dropna(subset=["time", "mag", "lat", "lon"])
+    df = read_catalog(path)
+
+    # Column arrays extracted once so queries never go through pandas.
+    # float32 (~1 m in position, well under catalog magnitude rounding)
+    # halves the bytes each regional scan reads. Coordinates are kept in
+    # radians with cos(lat) precomputed, so the catalog-side trig of the
+    # haversine is paid once per session.
+    lat_r = np.radians(df["lat"].to_numpy(np.float32))
+    cat = {
+        "lat_r": lat_r,
+        "lon_r": np.radians(df["lon"].to_numpy(np.float32)),
+        "cos_lat": np.cos(lat_r),
+        "mag": df["mag"].to_numpy(np.float32, copy=True),
+        "time_ns": df["time"].values.astype("datetime64[ns]").view(np.int64),
+    }
+    return cat
 
 
 # ============================================================
 # Regional selection
 # ============================================================
-def select_region(df, lat, lon, radius_km):
-    d = haversine(lat, lon, df["lat"].values, df["lon"].values)
-    return df[d <= radius_km]
+def select_region(cat, lat, lon, radius_km):
+    # boolean mask over the catalog arrays; callers index what they need
+    d = haversine(lat, lon, cat["lat_r"], cat["lon_r"], cat["cos_lat"])
+    return d <= radius_km
 
 
 # ============================================================
 # Fit Omori parameters regionally
 # ============================================================
-def fit_omori(df, t0):
-    df = df[df["time"] > t0]
-    if len(df) < 20:
+def fit_omori(time_ns, mask, t0_ns):
+    time_ns = time_ns[mask & (time_ns > t0_ns)]
+    if len(time_ns) < 20:
         return 0.3, 0.3, 1.1   # conservative fallback
 
-    days = (df["time"] - t0).dt.total_seconds() / 86400.0
-    hist, _ = np.histogram(days, bins=np.arange(0, 31))
+    # whole days since t0, straight from int64 nanoseconds
+    di = (time_ns - t0_ns) // DAY_NS
+    di = di[(di >= 0) & (di < 30)]
+    hist = np.bincount(di, minlength=30)
     t = np.arange(1, len(hist) + 1)
 
     try:
         popt, _ = curve_fit(
             omori_rate, t, hist,
+            p0=[0.3, 0.3, 1.1], jac=omori_jac,
             bounds=([0.05, 0.01, 0.8], [10.0, 5.0, 1.6]),
             maxfev=20000
         )
@@ -122,51 +207,51 @@ if not run:
 # ============================================================
 # Run model
 # ============================================================
-catalog = load_catalog(csv_path)
+cat = load_catalog(csv_path)
 main_time = pd.Timestamp.utcnow()
 
-regional = select_region(catalog, lat, lon, DEFAULT_RADIUS_KM)
+regional = select_region(cat, lat, lon, DEFAULT_RADIUS_KM)
 
-b_val = aki_b_value(regional["mag"].values, M0)
-K0, c, p = fit_omori(regional, main_time)
+b_val = aki_b_value(cat["mag"], M0, regional)
+K0, c, p = fit_omori(cat["time_ns"], regional, main_time.value)
 
 # === Productivity scaling (KEY FIX) ===
 K = K0 * (10 ** (ALPHA * (mag - 6.0)))
+integrator = make_integrator(K, c, p)
 
 # ============================================================
 # Forecast
 # ============================================================
-rows = []
+T_arr = np.array(TIME_WINDOWS, dtype=float)
+M_arr = np.array(MAG_THRESHOLDS, dtype=float)
 
-for T in TIME_WINDOWS:
-    base_rate = integrate_omori(K, c, p, T)
+# lam[i, j]: expected count in window i above threshold j
+base_rate = integrator(T_arr)
+gr = gr_tail_prob(M_arr, b_val)
+lam = base_rate[:, None] * gr[None, :]
 
-    for Mthr in MAG_THRESHOLDS:
-        lam = base_rate * gr_tail_prob(Mthr, b_val)
+# Soft probability saturation (not lambda cut!)
+prob = np.minimum(-np.expm1(-lam), MAX_PROB)
 
-        # Soft probability saturation (not lambda cut!)
-        prob = 1 - math.exp(-lam)
-        prob = min(prob, MAX_PROB)
-
-        rows.append({
-            "Window": {1: "1 Day", 7: "1 Week", 30: "1 Month"}[T],
-            "Magnitude": f"M ≥ {Mthr}",
-            "Probability (%)": round(prob * 100, 1)
-        })
-
-df_out = pd.DataFrame(rows)
+df_out = pd.DataFrame({
+    "Window": np.repeat([WINDOW_LABELS[T] for T in TIME_WINDOWS], len(MAG_THRESHOLDS)),
+    "Magnitude": np.tile([f"M ≥ {Mthr}" for Mthr in MAG_THRESHOLDS], len(TIME_WINDOWS)),
+    "Probability (%)": np.round(prob.ravel() * 100, 1)
+})
 
 # ============================================================
 # Text summary (USGS-like)
 # ============================================================
 st.subheader("Forecast Summary")
 
-for T in ["1 Day", "1 Week", "1 Month"]:
-    st.markdown(f"**Chance of ≥1 aftershock in the next {T.lower()}:**")
-    subset = df_out[df_out["Window"] == T]
-    for _, r in subset.iterrows():
-        st.write(f"- {r['Magnitude']}: **{r['Probability (%)']}%**")
-    st.write("")
+st.markdown("**Chance (%) of ≥1 aftershock in the next day, week, and month:**")
+pivot = df_out.pivot(
+    index="Magnitude", columns="Window", values="Probability (%)"
+).reindex(
+    index=[f"M ≥ {Mthr}" for Mthr in MAG_THRESHOLDS],
+    columns=[WINDOW_LABELS[T] for T in TIME_WINDOWS]
+)
+st.table(pivot.style.format("{:.1f}%"))
 
 # ============================================================
 # Visualization
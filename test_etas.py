@@ -3,12 +3,12 @@
 # Aftershock Forecast Validation
 # ============================================================
 
-import math
-from datetime import timedelta
+import os
 
 import numpy as np
 import pandas as pd
 from scipy.optimize import curve_fit
+from scipy.spatial import cKDTree
 
 # ------------------------------------------------------------
 # Parameters
@@ -16,6 +16,7 @@ from scipy.optimize import curve_fit
 CATALOG_PATH = "usgs_40yr.csv"
 N_MAINSHOCKS = 20
 RADIUS_KM = 250
+R_EARTH_KM = 6371.0
 M0 = 4.5
 TARGET_MAG = 5.0
 TIME_WINDOWS = [1, 7, 30]   # days
@@ -24,114 +25,182 @@ PROB_THRESHOLD = 0.5        # 50%
 # ------------------------------------------------------------
 # Utilities
 # ------------------------------------------------------------
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371.0
-    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = np.sin(dlat/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin(dlon/2)**2
-    return 2 * R * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+def unit_vectors(lat, lon):
+    # points on the unit sphere, for chord-distance KD-tree queries
+    lat, lon = np.radians(lat), np.radians(lon)
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
 
 
 def omori_rate(t, K, c, p):
     return K / ((c + t) ** p)
 
 
+def omori_jac(t, K, c, p):
+    # d(rate)/d(K, c, p), shape (len(t), 3)
+    u = (c + t) ** -p
+    return np.column_stack([u, -p * K * u / (c + t), -K * np.log(c + t) * u])
+
+
 def integrate_omori(K, c, p, T):
-    if abs(p - 1.0) < 1e-6:
-        return K * math.log((c + T) / c)
-    return K / (1 - p) * ((c + T)**(1 - p) - c**(1 - p))
+    # broadcasts over parameter and window arrays
+    near1 = np.abs(p - 1.0) < 1e-6
+    q = np.where(near1, 0.5, 1 - p)     # placeholder exponent where the log form is used
+    general = K / q * ((c + T)**q - c**q)
+    return np.where(near1, K * np.log((c + T) / c), general)
 
 
-def aki_b_value(mags, Mmin):
-    mags = mags[mags >= Mmin]
-    if len(mags) < 20:
-        return 1.0
-    return 0.4343 / (mags.mean() - Mmin)
+def aki_b_value(mags, groups, n_groups, Mmin):
+    # per-group estimate; groups[i] is the mainshock index of mags[i]
+    sel = mags >= Mmin
+    n = np.bincount(groups[sel], minlength=n_groups)
+    s = np.bincount(groups[sel], weights=mags[sel], minlength=n_groups)
+    mean = s / np.maximum(n, 1)
+    return np.where(n < 20, 1.0, 0.4343 / (mean - Mmin))
 
 
 def gr_tail(Mthr, b):
-    if Mthr <= M0:
-        return 1.0
-    return 10 ** (-b * (Mthr - M0))
+    # broadcasts over b, also when Mthr is at or below completeness
+    return np.where(Mthr <= M0, 1.0, 10 ** (-np.asarray(b) * (Mthr - M0)))
+
+
+def read_catalog(path):
+    # The parsed catalog is cached as Parquet next to the CSV and reused
+    # for as long as it is newer than the CSV.
+    pq_path = os.path.splitext(path)[0] + ".parquet"
+    if os.path.exists(pq_path) and (
+        not os.path.exists(path) or os.path.getmtime(pq_path) >= os.path.getmtime(path)
+    ):
+        try:
+            return pd.read_parquet(pq_path)
+        except Exception:
+            pass    # unreadable cache, fall back to the CSV
+
+    df = pd.read_csv(path, engine="pyarrow")
+    df["time"] = pd.to_datetime(df["time"], format="ISO8601", utc=True)
+    df = df.dropna(subset=["time", "mag", "lat", "lon"])
+    # write to a temp file and rename, so a partial write never
+    # replaces the cache
+    tmp_path = f"{pq_path}.{os.getpid()}.tmp"
+    try:
+        df.to_parquet(tmp_path, compression="zstd")
+        os.replace(tmp_path, pq_path)
+    except OSError:
+        # cache is best effort
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    return df
 
 
 # ------------------------------------------------------------
 # Load catalog
 # ------------------------------------------------------------
-df = pd.read_csv(CATALOG_PATH)
-df["time"] = pd.to_datetime(df["time"], format="mixed", utc=True)
-df = df.dropna(subset=["time", "mag", "lat", "lon"]).sort_values("time")
+df = read_catalog(CATALOG_PATH).sort_values("time")
+
+# spatial index, built once for all regional queries
+tree = cKDTree(unit_vectors(df["lat"].to_numpy(np.float64), df["lon"].to_numpy(np.float64)))
 
 # ------------------------------------------------------------
 # Select top-N mainshocks
 # ------------------------------------------------------------
 mainshocks = df.sort_values("mag", ascending=False).head(N_MAINSHOCKS)
 
-results = []
+# regional catalogs for all mainshocks in one batched query;
+# a great-circle radius r is a chord of 2*sin(r / 2R) on the unit sphere
+chord = 2 * np.sin(RADIUS_KM / (2 * R_EARTH_KM))
+neighbors = tree.query_ball_point(
+    unit_vectors(mainshocks["lat"].to_numpy(np.float64), mainshocks["lon"].to_numpy(np.float64)),
+    r=chord, return_sorted=True
+)
 
 # ------------------------------------------------------------
-# Validation loop
+# Flatten (mainshock, regional event) pairs
 # ------------------------------------------------------------
-for _, ms in mainshocks.iterrows():
-    t0 = ms["time"]
-    lat0, lon0 = ms["lat"], ms["lon"]
-    mag0 = ms["mag"]
+DAY_NS = 86_400_000_000_000
 
-    # regional catalog
-    dist = haversine(lat0, lon0, df["lat"].values, df["lon"].values)
-    regional = df[dist <= RADIUS_KM]
+time_ns = df["time"].values.astype("datetime64[ns]").view(np.int64)
+mag_arr = df["mag"].to_numpy(np.float64)
 
-    # aftershocks only (exclude mainshock itself)
-    after = regional[regional["time"] > t0]
+n_ms = len(mainshocks)
+t0_ns = mainshocks["time"].values.astype("datetime64[ns]").view(np.int64)
+mag0 = mainshocks["mag"].to_numpy(np.float64)
 
-    # estimate b-value
-    b = aki_b_value(regional["mag"].values, M0)
+counts = np.array([len(nb) for nb in neighbors])
+offsets = np.concatenate([[0], np.cumsum(counts)])
+ms_idx = np.repeat(np.arange(n_ms), counts)
+ev_idx = np.concatenate(neighbors).astype(np.int64)
 
-    # fit Omori (simple fallback)
-    days = (after["time"] - t0).dt.total_seconds() / 86400
-    hist, _ = np.histogram(days, bins=np.arange(0, 31))
-    t = np.arange(1, len(hist) + 1)
+dt_ns = time_ns[ev_idx] - t0_ns[ms_idx]
+mags = mag_arr[ev_idx]
+
+# estimate b-values
+b = aki_b_value(mags, ms_idx, n_ms, M0)
 
+# daily aftershock counts, shape (n_ms, 30); aftershocks only
+# (exclude mainshock itself)
+after = dt_ns > 0
+di = dt_ns[after] // DAY_NS
+keep = di < 30
+hist2d = np.bincount(
+    ms_idx[after][keep] * 30 + di[keep], minlength=n_ms * 30
+).reshape(n_ms, 30)
+
+# ------------------------------------------------------------
+# Validation loop
+# ------------------------------------------------------------
+t = np.arange(1, 31)
+params = np.empty((n_ms, 3))
+observed = np.zeros((n_ms, len(TIME_WINDOWS)), dtype=bool)
+window_ns = np.array(TIME_WINDOWS, dtype=np.int64) * DAY_NS
+
+for k in range(n_ms):
+    # fit Omori (simple fallback)
     try:
-        popt, _ = curve_fit(
-            omori_rate, t, hist,
+        params[k], _ = curve_fit(
+            omori_rate, t, hist2d[k],
+            p0=[0.3, 0.5, 1.1], jac=omori_jac,
             bounds=([0.01, 0.01, 0.8], [5.0, 5.0, 1.5])
         )
-        K0, c, p = popt
     except:
-        K0, c, p = 0.3, 0.5, 1.1
+        params[k] = 0.3, 0.5, 1.1
 
-    # productivity scaling
-    K = K0 * 10 ** (0.6 * (mag0 - 6.0))
+    # observed reality: events are time-sorted, so each window is a
+    # prefix of the aftershocks and the running max magnitude decides it
+    dt_k = dt_ns[offsets[k]:offsets[k + 1]]
+    m_k = mags[offsets[k]:offsets[k + 1]]
+    lo = np.searchsorted(dt_k, 0, side="right")
+    if lo < len(dt_k):
+        m_cummax = np.maximum.accumulate(m_k[lo:])
+        hi = np.searchsorted(dt_k[lo:], window_ns, side="right")
+        observed[k] = (hi > 0) & (m_cummax[hi - 1] >= TARGET_MAG)
 
-    for T in TIME_WINDOWS:
-        # model probability
-        lam = integrate_omori(K, c, p, T) * gr_tail(TARGET_MAG, b)
-        lam = min(lam, 2.0)
-        prob = 1 - math.exp(-lam)
+K0, c, p = params.T
 
-        predicted = prob >= PROB_THRESHOLD
+# productivity scaling
+K = K0 * 10 ** (0.6 * (mag0 - 6.0))
 
-        # observed reality
-        observed = any(
-            (after["time"] <= t0 + timedelta(days=T)) &
-            (after["mag"] >= TARGET_MAG)
-        )
+# model probability, shape (n_ms, len(TIME_WINDOWS))
+T_arr = np.array(TIME_WINDOWS, dtype=float)
+lam = integrate_omori(K[:, None], c[:, None], p[:, None], T_arr[None, :])
+lam = lam * gr_tail(TARGET_MAG, b)[:, None]
+lam = np.minimum(lam, 2.0)
+prob = -np.expm1(-lam)
 
-        results.append({
-            "mainshock_mag": round(mag0, 1),
-            "window_days": T,
-            "predicted_prob": round(prob, 3),
-            "predicted_event": predicted,
-            "observed_event": observed,
-            "correct": predicted == observed
-        })
+predicted = prob >= PROB_THRESHOLD
 
 # ------------------------------------------------------------
 # Results summary
 # ------------------------------------------------------------
-res = pd.DataFrame(results)
+res = pd.DataFrame({
+    "mainshock_mag": np.repeat(np.round(mag0, 1), len(TIME_WINDOWS)),
+    "window_days": np.tile(TIME_WINDOWS, n_ms),
+    "predicted_prob": np.round(prob.ravel(), 3),
+    "predicted_event": predicted.ravel(),
+    "observed_event": observed.ravel(),
+    "correct": (predicted == observed).ravel()
+})
 
 print("\n=== VALIDATION SUMMARY ===\n")
 for T in TIME_WINDOWS:
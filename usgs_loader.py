@@ -10,20 +10,41 @@ Usage:
 """
 
 import argparse
-import csv
-import json
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import time
+import orjson
+import pyarrow as pa
+import pyarrow.csv as pac
 import requests
+from requests.adapters import HTTPAdapter
 
 DEFAULT_MINLAT = 24.0
 DEFAULT_MAXLAT = 42.0
 DEFAULT_MINLON = 44.0
 DEFAULT_MAXLON = 64.0
 
-def fetch_year(year, minlat, maxlat, minlon, maxlon, timeout=30):
+SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("time", pa.string()),
+    ("mag", pa.float64()),
+    ("depth", pa.float64()),
+    ("lon", pa.float64()),
+    ("lat", pa.float64()),
+    ("place", pa.string()),
+    ("type", pa.string()),
+])
+
+def make_session(pool_size=8):
+    # keep-alive connection pool shared by the download workers
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    return session
+
+def fetch_year(session, year, minlat, maxlat, minlon, maxlon, timeout=30, sleep_sec=0.0):
     t0 = f"{year}-01-01"
     t1 = f"{year}-12-31"
     url = (
@@ -33,9 +54,13 @@ def fetch_year(year, minlat, maxlat, minlon, maxlon, timeout=30):
         f"&minlongitude={minlon}&maxlongitude={maxlon}"
         "&orderby=time-asc&limit=20000"
     )
-    r = requests.get(url, timeout=timeout)
+    r = session.get(url, timeout=timeout)
     r.raise_for_status()
-    return r.json().get("features", [])
+    # orjson parses the (up to 20k-feature) payload several times faster
+    feats = orjson.loads(r.content).get("features", [])
+    # per-worker delay to stay polite to USGS
+    time.sleep(sleep_sec)
+    return feats
 
 def parse_feature(f):
     p = f.get("properties", {})
@@ -57,6 +82,39 @@ def parse_feature(f):
         "type": p.get("type")
     }
 
+def coerce_row(rec):
+    # cast a parsed record to SCHEMA types; None if a value does not fit
+    out = {}
+    for field in SCHEMA:
+        v = rec.get(field.name)
+        if v is not None:
+            try:
+                v = float(v) if pa.types.is_floating(field.type) else str(v)
+            except (TypeError, ValueError):
+                return None
+        out[field.name] = v
+    return out
+
+def fetch_and_parse_year(session, year, minlat, maxlat, minlon, maxlon, sleep_sec=0.0):
+    # runs in a worker, so a fetch or parse error only fails this year
+    print(f"[INFO] Fetching year {year} ...", flush=True)
+    feats = fetch_year(session, year, minlat, maxlat, minlon, maxlon, sleep_sec=sleep_sec)
+    rows = []
+    n_bad = 0
+    for f in feats:
+        rec = parse_feature(f)
+        # only keep records with mag and time and lat/lon
+        if rec["mag"] is None or rec["time"] is None or rec["lat"] is None or rec["lon"] is None:
+            continue
+        rec = coerce_row(rec)
+        if rec is None:
+            n_bad += 1
+            continue
+        rows.append(rec)
+    if n_bad:
+        print(f"[WARN] year {year}: skipped {n_bad} records with non-numeric values", file=sys.stderr)
+    return len(feats), rows
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--start-year", type=int, default=1985)
@@ -67,38 +125,40 @@ def main():
     parser.add_argument("--maxlon", type=float, default=DEFAULT_MAXLON)
     parser.add_argument("--out", type=str, default="usgs_40yr.csv")
     parser.add_argument("--resume", action="store_true", help="if out exists, skip download")
-    parser.add_argument("--sleep-sec", type=float, default=1.0, help="delay between year requests")
+    parser.add_argument("--sleep-sec", type=float, default=1.0, help="delay between year requests (per worker)")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent year downloads")
     args = parser.parse_args()
 
     if args.resume and os.path.exists(args.out):
         print(f"[INFO] {args.out} exists and --resume set -> skipping download.")
         return
 
-    header = ["id", "time", "mag", "depth", "lon", "lat", "place", "type"]
-
-    all_rows = []
-    for year in range(args.start_year, args.end_year + 1):
-        try:
-            print(f"[INFO] Fetching year {year} ...", flush=True)
-            feats = fetch_year(year, args.minlat, args.maxlat, args.minlon, args.maxlon)
-            for f in feats:
-                rec = parse_feature(f)
-                # only keep records with mag and time and lat/lon
-                if rec["mag"] is None or rec["time"] is None or rec["lat"] is None or rec["lon"] is None:
-                    continue
-                all_rows.append(rec)
-            time.sleep(args.sleep_sec)
-            print(f"[INFO] Year {year}: fetched {len(feats)} features; total so far {len(all_rows)}")
-        except Exception as e:
-            print(f"[WARN] failed to fetch year {year}: {e}", file=sys.stderr)
+    years = range(args.start_year, args.end_year + 1)
+    rows_by_year = {}
+    total = 0
+    with make_session(max(args.workers, 1)) as session, \
+            ThreadPoolExecutor(max_workers=max(args.workers, 1)) as ex:
+        futures = {}
+        for year in years:
+            futures[ex.submit(fetch_and_parse_year, session, year, args.minlat, args.maxlat,
+                              args.minlon, args.maxlon, sleep_sec=args.sleep_sec)] = year
+        for fut in as_completed(futures):
+            year = futures[fut]
+            try:
+                n_feats, rows = fut.result()
+            except Exception as e:
+                print(f"[WARN] failed to fetch year {year}: {e}", file=sys.stderr)
+                continue
+            rows_by_year[year] = rows
+            total += len(rows)
+            print(f"[INFO] Year {year}: fetched {n_feats} features; total so far {total}")
+
+    # keep chronological order regardless of completion order
+    all_rows = [rec for year in years for rec in rows_by_year.get(year, [])]
 
     # write CSV
     print(f"[INFO] Writing {len(all_rows)} records to {args.out}")
-    with open(args.out, "w", newline="", encoding="utf-8") as fh:
-        writer = csv.DictWriter(fh, fieldnames=header)
-        writer.writeheader()
-        for r in all_rows:
-            writer.writerow(r)
+    pac.write_csv(pa.Table.from_pylist(all_rows, schema=SCHEMA), args.out)
     print("[INFO] Done.")
 
 if __name__ == "__main__":